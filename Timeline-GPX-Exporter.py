@@ -13,17 +13,87 @@ Gebruik:
 """
 
 import os
-import json
 import argparse
-import xml.etree.ElementTree as ET
-import xml.dom.minidom
-from datetime import datetime
+import functools
+import re
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, TypedDict
+from xml.sax.saxutils import escape
+
+# orjson is optioneel: decodeert grote Timeline.json bestanden veel sneller
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# msgspec is optioneel: decodeert alleen de velden die we gebruiken (zie schema hieronder)
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# ijson is optioneel: streamt segmenten zodat het geheugengebruik begrensd blijft
+# Alleen met een C backend: de pure Python backend is vele malen trager dan json
+try:
+    import ijson
+    if ijson.backend not in ("yajl2_c", "yajl2_cffi"):
+        ijson = None
+except ImportError:
+    ijson = None
 
 # Configuratie
 startDate = '2000-01-01'
 endDate = '2099-12-31'
 verbose = True
 groupByMonth = True
+sortedInput = False
+
+# Leesbuffer voor het inlezen van Timeline.json
+READ_BUFFER_SIZE = 1 << 20
+
+# GPX wordt direct naar bestand geschreven, zonder tussenliggende ElementTree
+GPX_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    '<gpx version="1.1" creator="Timeline-GPX-Exporter" '
+    'xmlns="http://www.topografix.com/GPX/1/1">\n'
+)
+GPX_FOOTER = "</gpx>\n"
+GPX_TRKPT = '\t\t\t<trkpt lat="{}" lon="{}"><time>{}</time></trkpt>\n'
+
+
+# Timeline schema voor msgspec: onbekende velden (visit, rawSignals, ...) worden
+# overgeslagen, de segmenten blijven gewone dicts voor process_segment
+class PathPoint(TypedDict, total=False):
+    point: Any
+    time: str
+
+
+class Activity(TypedDict, total=False):
+    start: Any
+    end: Any
+    distanceMeters: float
+    topCandidate: dict
+
+
+class Segment(TypedDict, total=False):
+    startTime: str
+    endTime: str
+    timelinePath: List[PathPoint]
+    activity: Activity
+
+
+class Timeline(TypedDict, total=False):
+    semanticSegments: List[Segment]
+
+
+# Coördinaat string: "52.123°, 4.567°", "52.123, 4.567" of "geo:52.123,4.567"
+# Getallen zoals float() ze accepteert: "52", "52.", ".5", "1e-3"
+_NUMBER = r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?'
+_COORD_RE = re.compile(
+    rf'(?:geo:)?\s*({_NUMBER})°?\s*,\s*({_NUMBER})°?\s*'
+)
 
 
 def parse_coords(coord_data):
@@ -41,17 +111,9 @@ def parse_coords(coord_data):
     
     # String formaat: "52.123°, 4.567°"
     if isinstance(coord_data, str):
-        # Check voor geo: URI formaat
-        if coord_data.startswith("geo:"):
-            coord_data = coord_data[4:]  # Strip "geo:"
-        
-        raw = coord_data.replace("°", "").strip()
-        parts = raw.split(", ") if ", " in raw else raw.split(",")
-        if len(parts) == 2:
-            try:
-                return float(parts[0]), float(parts[1])
-            except ValueError:
-                return None, None
+        m = _COORD_RE.fullmatch(coord_data)
+        if m:
+            return float(m.group(1)), float(m.group(2))
         return None, None
     
     # Dictionary formaat
@@ -86,203 +148,259 @@ def parse_coords(coord_data):
     return None, None
 
 
-def parse_timestamp(time_str):
-    """Parse timestamp en return ISO format"""
-    if not time_str:
-        return None
-    try:
-        clean = time_str.replace(".000", "")
-        return datetime.fromisoformat(clean.replace('Z', '+00:00'))
-    except ValueError:
-        return None
+def clean_timestamp(time_str):
+    """Verwijder lege milliseconden (".000") uit een ISO timestamp"""
+    # Snelle route voor het gangbare formaat "...:00.000Z"
+    if time_str.endswith(".000Z"):
+        return time_str[:-5] + "Z"
+    return time_str.replace(".000", "")
+
 
+@functools.lru_cache(maxsize=8192)
+def format_coord(value):
+    """Formatteer coördinaat met vaste 7 decimalen (gecached, stilstand herhaalt punten)"""
+    return f"{value:.7f}"
 
-def create_gpx_tracks(points, output_file):
-    """Maak GPX bestand met tracks (voor ruwe GPS punten)"""
-    gpx = ET.Element("gpx", 
-                     version="1.1", 
-                     creator="Timeline-GPX-Exporter",
-                     xmlns="http://www.topografix.com/GPX/1/1")
+
+def create_gpx_tracks(track, output_file):
+    """
+    Maak GPX bestand met tracks (voor ruwe GPS punten)
     
-    trk = ET.SubElement(gpx, "trk")
-    ET.SubElement(trk, "name").text = f"Track {os.path.basename(output_file)}"
-    trkseg = ET.SubElement(trk, "trkseg")
+    track is een tuple (lats, lons, times) van parallelle reeksen
+    """
+    lats, lons, times = track
+    name = escape(f"Track {os.path.basename(output_file)}")
     
-    lastDateTime = None
-    for point in points:
-        dateTime = point["time"]
-        # Nieuw segment bij nieuwe dag
-        if lastDateTime is not None and lastDateTime[0:10] != dateTime[0:10]:
-            trkseg = ET.SubElement(trk, "trkseg")
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(GPX_HEADER)
+        f.write(f"\t<trk>\n\t\t<name>{name}</name>\n\t\t<trkseg>\n")
+        
+        # Nieuw segment bij nieuwe dag: bepaal de grenzen vooraf in één pass
+        days = [t[0:10] for t in times]
+        breaks = [i for i, (a, b) in enumerate(zip(days, days[1:]), 1) if a != b]
+        bounds = [0, *breaks, len(times)]
+        
+        lats = lats.tolist()
+        lons = lons.tolist()
+        for start, end in zip(bounds, bounds[1:]):
+            if start:
+                f.write("\t\t</trkseg>\n\t\t<trkseg>\n")
+            
+            # Eén write per segment in plaats van één per punt
+            f.write("".join(
+                GPX_TRKPT.format(format_coord(lat), format_coord(lon), escape(dateTime))
+                for lat, lon, dateTime in zip(lats[start:end], lons[start:end], times[start:end])
+            ))
         
-        trkpt = ET.SubElement(trkseg, "trkpt", 
-                              lat=str(point["lat"]), 
-                              lon=str(point["lon"]))
-        ET.SubElement(trkpt, "time").text = dateTime
-        lastDateTime = dateTime
+        f.write("\t\t</trkseg>\n\t</trk>\n")
+        f.write(GPX_FOOTER)
     
-    write_gpx(gpx, output_file)
-    return len(points)
+    return len(times)
 
 
 def create_gpx_routes(routes, output_file):
     """Maak GPX bestand met routes (voor activiteiten/verplaatsingen)"""
-    gpx = ET.Element("gpx", 
-                     version="1.1", 
-                     creator="Timeline-GPX-Exporter",
-                     xmlns="http://www.topografix.com/GPX/1/1")
-    
-    for route in routes:
-        rte = ET.SubElement(gpx, "rte")
-        
-        # Route metadata
-        name = route.get("name", "Route")
-        ET.SubElement(rte, "name").text = name
-        
-        if route.get("type"):
-            ET.SubElement(rte, "type").text = route["type"]
-        
-        if route.get("description"):
-            ET.SubElement(rte, "desc").text = route["description"]
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(GPX_HEADER)
         
-        # Route punten
-        for i, point in enumerate(route["points"]):
-            rtept = ET.SubElement(rte, "rtept",
-                                  lat=str(point["lat"]),
-                                  lon=str(point["lon"]))
+        for route in routes:
+            f.write("\t<rte>\n")
+            
+            # Route metadata
+            name = route.get("name", "Route")
+            f.write(f"\t\t<name>{escape(name)}</name>\n")
+            
+            if route.get("type"):
+                f.write(f"\t\t<type>{escape(route['type'])}</type>\n")
             
-            if point.get("time"):
-                ET.SubElement(rtept, "time").text = point["time"]
+            if route.get("description"):
+                f.write(f"\t\t<desc>{escape(route['description'])}</desc>\n")
             
-            # Optioneel: naam voor start/eindpunt
-            if i == 0:
-                ET.SubElement(rtept, "name").text = "Start"
-            elif i == len(route["points"]) - 1:
-                ET.SubElement(rtept, "name").text = "Einde"
+            # Route punten
+            last = len(route["points"]) - 1
+            for i, point in enumerate(route["points"]):
+                f.write(f'\t\t<rtept lat="{format_coord(point["lat"])}" '
+                        f'lon="{format_coord(point["lon"])}">')
+                
+                if point.get("time"):
+                    f.write(f"<time>{escape(point['time'])}</time>")
+                
+                # Optioneel: naam voor start/eindpunt
+                if i == 0:
+                    f.write("<name>Start</name>")
+                elif i == last:
+                    f.write("<name>Einde</name>")
+                
+                f.write("</rtept>\n")
+            
+            f.write("\t</rte>\n")
+        
+        f.write(GPX_FOOTER)
     
-    write_gpx(gpx, output_file)
     return len(routes)
 
 
-def write_gpx(gpx_element, output_file):
-    """Schrijf GPX element naar bestand met pretty printing"""
-    xml_str = xml.dom.minidom.parseString(
-        ET.tostring(gpx_element)
-    ).toprettyxml(indent='\t')
-    
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(xml_str)
-
-
 def parse_json(input_file):
     """
     Parse Timeline JSON en extraheer zowel tracks als routes
     
     Returns:
-        tracks_by_date: dict met ruwe GPS punten per datum
+        tracks_by_date: dict met ruwe GPS punten per datum, als tuple
+                        (lats, lons, times) van array('d'), array('d'), list
         routes_by_date: dict met activiteit routes per datum
     """
-    with open(input_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    tracks_by_date = defaultdict(lambda: (array('d'), array('d'), []))
+    routes_by_date = defaultdict(list)
     
-    tracks_by_date = {}
-    routes_by_date = {}
-    
-    for segment in data.get("semanticSegments", []):
-        # Bepaal datum van segment
-        start_time = segment.get("startTime")
-        if not start_time:
-            continue
-        
-        dt = parse_timestamp(start_time)
-        if not dt:
-            continue
-        
-        date = dt.date().isoformat()
+    # Grote leesbuffer: minder read syscalls bij Timeline.json van 100+ MB
+    with open(input_file, "rb", buffering=READ_BUFFER_SIZE) as f:
+        if ijson is not None:
+            # Stream segment voor segment: verwerken overlapt met parsen
+            segments = ijson.items(f, "semanticSegments.item", use_float=True,
+                                   buf_size=READ_BUFFER_SIZE)
+        else:
+            segments = load_segments(f.read())
         
-        # Filter op datum
-        if date < startDate or date > endDate:
-            continue
-        
-        # Groepeer per maand indien gewenst
-        date_key = date[0:7] if groupByMonth else date
-        
-        # TRACKS: Verwerk timelinePath (ruwe GPS punten)
-        for path_point in segment.get("timelinePath", []):
-            try:
-                lat, lon = parse_coords(path_point.get("point"))
-                if lat is None:
-                    continue
-                
-                time = path_point.get("time", "").replace(".000", "")
-                
-                if date_key not in tracks_by_date:
-                    tracks_by_date[date_key] = []
-                
-                tracks_by_date[date_key].append({
-                    "lat": lat, 
-                    "lon": lon, 
-                    "time": time
-                })
-            except (KeyError, ValueError):
+        for segment in segments:
+            date = process_segment(segment, tracks_by_date, routes_by_date)
+            # Gesorteerde input: alle volgende segmenten vallen ook na endDate
+            if sortedInput and date is not None and date > endDate:
+                break
+    
+    return tracks_by_date, routes_by_date
+
+
+def load_segments(raw):
+    """Decodeer volledige Timeline JSON (bytes) naar een lijst segmenten"""
+    if msgspec is not None:
+        try:
+            return msgspec.json.decode(raw, type=Timeline).get("semanticSegments", [])
+        except msgspec.ValidationError:
+            # Afwijkend schema: val terug op ongetypeerd decoderen
+            pass
+    
+    # Zowel orjson als json accepteren UTF-8 bytes
+    return _json.loads(raw).get("semanticSegments", [])
+
+
+def process_segment(segment, tracks_by_date, routes_by_date):
+    """
+    Verwerk één semantic segment naar tracks_by_date en routes_by_date
+    
+    Returns:
+        datum (YYYY-MM-DD) van het segment, of None bij een ongeldige startTime
+    """
+    # Bepaal datum van segment
+    start_time = segment.get("startTime")
+    if not start_time:
+        return None
+    
+    # ISO-8601: de datum is altijd de eerste 10 tekens, parsen is niet nodig
+    if len(start_time) < 10 or start_time[4] != '-' or start_time[7] != '-':
+        return None
+    
+    date = start_time[:10]
+    
+    # Filter op datum (goedkope string vergelijking, vóór het verwerken van punten)
+    if date < startDate or date > endDate:
+        return date
+    
+    # Groepeer per maand indien gewenst
+    date_key = date[0:7] if groupByMonth else date
+    
+    # TRACKS: Verwerk timelinePath (ruwe GPS punten)
+    # Geldige punten eerst lokaal verzamelen, daarna in één keer toevoegen
+    lats = []
+    lons = []
+    times = []
+    for path_point in segment.get("timelinePath", []):
+        try:
+            lat, lon = parse_coords(path_point.get("point"))
+            if lat is None:
                 continue
+            
+            lats.append(lat)
+            lons.append(lon)
+            times.append(clean_timestamp(path_point.get("time", "")))
+        except (KeyError, ValueError):
+            continue
+    
+    if times:
+        track_lats, track_lons, track_times = tracks_by_date[date_key]
+        track_lats.extend(lats)
+        track_lons.extend(lons)
+        track_times.extend(times)
+    
+    # ROUTES: Verwerk activity segments (verplaatsingen met start/eind)
+    activity = segment.get("activity")
+    if activity:
+        start_lat, start_lon = parse_coords(activity.get("start"))
+        end_lat, end_lon = parse_coords(activity.get("end"))
         
-        # ROUTES: Verwerk activity segments (verplaatsingen met start/eind)
-        activity = segment.get("activity")
-        if activity:
-            start_lat, start_lon = parse_coords(activity.get("start"))
-            end_lat, end_lon = parse_coords(activity.get("end"))
+        # Alleen routes maken als we start EN eind hebben
+        if start_lat is not None and end_lat is not None:
+            top_candidate = activity.get("topCandidate", {})
+            activity_type = top_candidate.get("type", "UNKNOWN")
+            distance = activity.get("distanceMeters")
             
-            # Alleen routes maken als we start EN eind hebben
-            if start_lat is not None and end_lat is not None:
-                top_candidate = activity.get("topCandidate", {})
-                activity_type = top_candidate.get("type", "UNKNOWN")
-                distance = activity.get("distanceMeters")
-                
-                end_time = segment.get("endTime", "").replace(".000", "")
-                start_time_clean = start_time.replace(".000", "")
-                
-                # Bouw route beschrijving
-                desc_parts = []
-                if distance:
-                    desc_parts.append(f"{distance/1000:.1f} km")
-                if activity_type:
-                    desc_parts.append(activity_type)
-                
-                route = {
-                    "name": f"{activity_type} {start_time_clean[11:16]}",
-                    "type": activity_type,
-                    "description": " - ".join(desc_parts) if desc_parts else None,
-                    "points": [
-                        {"lat": start_lat, "lon": start_lon, "time": start_time_clean},
-                        {"lat": end_lat, "lon": end_lon, "time": end_time}
-                    ]
-                }
-                
-                # Voeg tussenliggende punten toe als timelinePath beschikbaar is
-                timeline_path = segment.get("timelinePath", [])
-                if timeline_path:
-                    intermediate_points = []
-                    for path_point in timeline_path:
-                        lat, lon = parse_coords(path_point.get("point"))
-                        if lat is not None:
-                            time = path_point.get("time", "").replace(".000", "")
-                            intermediate_points.append({
-                                "lat": lat, 
-                                "lon": lon, 
-                                "time": time
-                            })
-                    
-                    if intermediate_points:
-                        # Vervang route punten met volledige path
-                        route["points"] = intermediate_points
-                
-                if date_key not in routes_by_date:
-                    routes_by_date[date_key] = []
-                
-                routes_by_date[date_key].append(route)
+            end_time = clean_timestamp(segment.get("endTime", ""))
+            start_time_clean = clean_timestamp(start_time)
+            
+            # Bouw route beschrijving
+            desc_parts = []
+            if distance:
+                desc_parts.append(f"{distance/1000:.1f} km")
+            if activity_type:
+                desc_parts.append(activity_type)
+            
+            route = {
+                "name": f"{activity_type} {start_time_clean[11:16]}",
+                "type": activity_type,
+                "description": " - ".join(desc_parts) if desc_parts else None,
+                "points": [
+                    {"lat": start_lat, "lon": start_lon, "time": start_time_clean},
+                    {"lat": end_lat, "lon": end_lon, "time": end_time}
+                ]
+            }
+            
+            # Voeg tussenliggende punten toe als timelinePath beschikbaar is
+            # (hergebruik de punten die al voor de tracks zijn geparsed)
+            if times:
+                # Vervang route punten met volledige path
+                route["points"] = [
+                    {"lat": lat, "lon": lon, "time": time}
+                    for lat, lon, time in zip(lats, lons, times)
+                ]
+            
+            routes_by_date[date_key].append(route)
     
-    return tracks_by_date, routes_by_date
+    return date
+
+
+def write_gpx_files(jobs):
+    """
+    Schrijf GPX bestanden, parallel waar mogelijk
+    
+    jobs is een lijst van (create_functie, data, output_file); geeft per job
+    het aantal geschreven punten/routes terug, in dezelfde volgorde
+    """
+    # Bestanden per datum zijn onafhankelijk: schrijf ze parallel als dat loont
+    if len(jobs) > 1:
+        executor = None
+        try:
+            executor = ProcessPoolExecutor()
+            futures = [executor.submit(create, data, output_file)
+                       for create, data, output_file in jobs]
+        except (NotImplementedError, OSError):
+            # Geen werkende multiprocessing (bijv. Android/Termux): serieel verder
+            if executor is not None:
+                executor.shutdown()
+        else:
+            # Fouten bij het schrijven zelf (rechten, schijf vol, ...) gewoon doorgeven
+            with executor:
+                return [future.result() for future in futures]
+    
+    return [create(data, output_file) for create, data, output_file in jobs]
 
 
 def main():
@@ -314,15 +432,18 @@ Voorbeelden:
                         help='Groepeer per dag ipv maand')
     parser.add_argument('--quiet', '-q', action='store_true',
                         help='Onderdruk output berichten')
+    parser.add_argument('--sorted-input', action='store_true',
+                        help='Segmenten zijn gesorteerd op startTime: stop na --end')
     
     args = parser.parse_args()
     
     # Configuratie toepassen
-    global startDate, endDate, verbose, groupByMonth
+    global startDate, endDate, verbose, groupByMonth, sortedInput
     startDate = args.start
     endDate = args.end
     verbose = not args.quiet
     groupByMonth = not args.daily
+    sortedInput = args.sorted_input
     
     script_dir = os.getcwd()
     input_file = args.input if os.path.isabs(args.input) else os.path.join(script_dir, args.input)
@@ -345,27 +466,46 @@ Voorbeelden:
     total_tracks = 0
     total_routes = 0
     
-    # Exporteer tracks
+    jobs = []
     if args.format in ['tracks', 'both']:
-        if verbose:
-            print("=== TRACKS ===")
-        for date, points in sorted(tracks_by_date.items()):
+        for date, track in tracks_by_date.items():
             output_file = os.path.join(output_dir, f"{date}_track.gpx")
-            count = create_gpx_tracks(points, output_file)
-            total_tracks += count
-            if verbose:
-                print(f"  {output_file}: {count} punten")
+            jobs.append(("tracks", date, create_gpx_tracks, track, output_file))
     
-    # Exporteer routes
     if args.format in ['routes', 'both']:
-        if verbose:
-            print("\n=== ROUTES ===")
-        for date, routes in sorted(routes_by_date.items()):
+        for date, routes in routes_by_date.items():
             output_file = os.path.join(output_dir, f"{date}_routes.gpx")
-            count = create_gpx_routes(routes, output_file)
+            jobs.append(("routes", date, create_gpx_routes, routes, output_file))
+    
+    counts = write_gpx_files([job[2:] for job in jobs])
+    
+    track_results = {}
+    route_results = {}
+    for (kind, date, _, _, output_file), count in zip(jobs, counts):
+        if kind == "tracks":
+            total_tracks += count
+            track_results[date] = (output_file, count)
+        else:
             total_routes += count
-            if verbose:
-                print(f"  {output_file}: {count} routes")
+            route_results[date] = (output_file, count)
+    
+    # Rapporteer in datumvolgorde (één sortering voor beide formaten)
+    if verbose:
+        dates_sorted = sorted(track_results.keys() | route_results.keys())
+        
+        if args.format in ['tracks', 'both']:
+            print("=== TRACKS ===")
+            for date in dates_sorted:
+                if date in track_results:
+                    output_file, count = track_results[date]
+                    print(f"  {output_file}: {count} punten")
+        
+        if args.format in ['routes', 'both']:
+            print("\n=== ROUTES ===")
+            for date in dates_sorted:
+                if date in route_results:
+                    output_file, count = route_results[date]
+                    print(f"  {output_file}: {count} routes")
     
     if verbose:
         print(f"\n✓ Gereed!")